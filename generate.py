@@ -30,19 +30,74 @@ Example data file
 
 """
 import argparse
+import collections
+import concurrent.futures
 import contextlib
+import copy
 import datetime
-import locale
+import functools
+import logging
 import os
+import shutil
+import types
 import warnings
 
 import yaml
 from dateutil import easter
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 with warnings.catch_warnings():
     warnings.simplefilter('ignore')
     from relatorio.templates.opendocument import Template
 
 
+# Performance note: JIT compilers such as Numba can't compile this module.
+# It works with datetime.date objects, strings and dicts keyed by dates,
+# none of which Numba supports in nopython mode. Speed comes from
+# computing things once instead: the per-year holiday table, the birthday
+# and wedding indexes, the cached configuration and the LibYAML loader.
+
+FIXED_HOLIDAYS = {
+    1: {1: 'Nieuwjaar', 6: 'Drie Koningen'},
+    2: {14: 'Valentijn'},
+    4: {27: 'Koningsdag'},
+    5: {4: 'Dodenherdenking', 5: 'Bevrijdingsdag'},
+    7: {29: 'Frikandellendag'},
+    10: {4: 'Dierendag'},
+    12: {
+        5: 'Sinterklaas',
+        25: 'Eerste Kerstdag',
+        26: 'Tweede Kerstdag',
+        31: 'Oudjaar',
+    },
+}
+
+MONTHS = [
+    'Januari', 'Februari', 'Maart', 'April', 'Mei', 'Juni', 'Juli',
+    'Augustus', 'September', 'Oktober', 'November', 'December',
+]
+
+SHORT_MONTHS = [
+    'jan', 'feb', 'mrt', 'apr', 'mei', 'jun', 'jul', 'aug', 'sep', 'okt',
+    'nov', 'dec',
+]
+
+WEEK_DAYS = [
+    'Maandag', 'Dinsdag', 'Woensdag', 'Donderdag', 'Vrijdag', 'Zaterdag',
+    'Zondag',
+]
+
+WEEK_DAY_KEYS = 'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'
+
+logger = logging.getLogger(__name__)
+
+_config_cache = collections.OrderedDict()
+
+_worker_args = ()
+
+
 class BadConfigError(Exception):
     """
     Raised when an invalid configuration is found.
@@ -50,6 +105,50 @@ class BadConfigError(Exception):
     """
 
 
+def load_config(path):
+    """
+    Load a YAML configuration file.
+
+    Parsed files are cached by their path, modification time and size, so
+    loading an unchanged file again doesn't parse it again.
+
+    Args:
+        path (str): The path of the configuration to load.
+
+    Returns:
+        object: A copy of the parsed YAML document.
+
+    """
+    stat = os.stat(path)
+    key = stat.st_mtime_ns, stat.st_size
+    cached = _config_cache.get(path)
+    if cached is None or cached[0] != key:
+        with open(path) as f:
+            cached = key, yaml.load(f, SafeLoader)
+        _config_cache[path] = cached
+        if len(_config_cache) > 8:
+            _config_cache.popitem(last=False)
+    _config_cache.move_to_end(path)
+    return copy.deepcopy(cached[1])
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(template_path):
+    """
+    Load an odt template.
+
+    Templates are cached by their path, so they are only parsed once.
+
+    Args:
+        template_path (str): The file path of the template to load.
+
+    Returns:
+        relatorio.templates.opendocument.Template: The loaded template.
+
+    """
+    return Template(source=None, filepath=template_path)
+
+
 def start_date(year):
     """
     Find the first day of the first week of the given year.
@@ -65,6 +164,79 @@ def start_date(year):
     return jan_01 - datetime.timedelta(days=jan_01.weekday())
 
 
+def weekday_on_or_after(date, weekday):
+    """
+    Find the first occurrence of a weekday on or after a date.
+
+    Args:
+        date (datetime.date): The earliest date to return.
+        weekday (int): The weekday to find, where monday is 0 and sunday
+            is 6.
+
+    Returns:
+        datetime.date: The first date with the given weekday on or after
+            the given date.
+
+    """
+    return date + datetime.timedelta(days=(weekday - date.weekday()) % 7)
+
+
+@functools.lru_cache(maxsize=4)
+def _holiday_table(year):
+    """
+    Calculate all holidays for the given year.
+
+    Args:
+        year (int): The year for which to calculate the holidays.
+
+    Returns:
+        types.MappingProxyType: A read-only mapping of
+            :class:`datetime.date` objects to the Dutch name of the holiday
+            on that date.
+
+    """
+    table = {}
+
+    # Simple hardcoded dates
+    for month, days in FIXED_HOLIDAYS.items():
+        for day, name in days.items():
+            table[datetime.date(year, month, day)] = name
+
+    # Nth weekday of month
+    nth_weekdays = [
+        (3, 25, 6, 'Zomertijd\n'
+                   'Vergeet niet je klok niet een uur vooruit te zetten!'),
+        (5, 8, 6, 'Moederdag'),
+        (6, 15, 6, 'Vaderdag'),
+        (9, 16, 1, 'Prinsjesdag'),
+        (10, 25, 6,
+         'Wintertijd\nVergeet niet je klok een uur terug te zetten!'),
+    ]
+    for month, day, weekday, name in nth_weekdays:
+        date = weekday_on_or_after(datetime.date(year, month, day), weekday)
+        table.setdefault(date, name)
+
+    # Easter related
+    easter_date = easter.easter(year)
+    easter_offsets = [
+        (0, 'Eerste Paasdag'),
+        (-2, 'Goede Vrijdag'),
+        (1, 'Tweede Paasdag'),
+        (39, 'Hemelvaart'),
+        (49, 'Eerste Pinksterdag'),
+        (50, 'Tweede Pinksterdag'),
+    ]
+    for offset, name in easter_offsets:
+        table.setdefault(easter_date + datetime.timedelta(days=offset), name)
+
+    # Carnaval lasts from sunday until tuesday, 7 weeks before easter.
+    carnaval_date = easter_date - datetime.timedelta(days=49)
+    for i in range(3):
+        date = carnaval_date + datetime.timedelta(days=i)
+        table.setdefault(date, 'Carnaval')
+    return types.MappingProxyType(table)
+
+
 def holiday(date):
     """
     Return if the given date is a holiday.
@@ -76,78 +248,28 @@ def holiday(date):
         str: The Dutch name of the holiday on that date or an empty string.
 
     """
-    # Simple hardcoded dates
-    if date.month == 1:
-        if date.day == 1:
-            return 'Nieuwjaar'
-        if date.day == 6:
-            return 'Drie Koningen'
-    if date.month == 2:
-        if date.day == 14:
-            return 'Valentijn'
-    if date.month == 4:
-        if date.day == 27:
-            return 'Koningsdag'
-    if date.month == 5:
-        if date.day == 4:
-            return 'Dodenherdenking'
-        if date.day == 5:
-            return 'Bevrijdingsdag'
-    if date.month == 7:
-        if date.day == 29:
-            return 'Frikandellendag'
-    if date.month == 10:
-        if date.day == 4:
-            return 'Dierendag'
-    if date.month == 12:
-        if date.day == 5:
-            return 'Sinterklaas'
-        if date.day == 25:
-            return 'Eerste Kerstdag'
-        if date.day == 26:
-            return 'Tweede Kerstdag'
-        if date.day == 31:
-            return 'Oudjaar'
-
-    # Nth sunday of month
-    if date.month == 3 and date.weekday() == 6 and date.day > 24:
-        return ('Zomertijd\n'
-                'Vergeet niet je klok niet een uur vooruit te zetten!')
-    if date.month == 5 and date.weekday() == 6 and 7 < date.day < 15:
-        return 'Moederdag'
-    if date.month == 6 and date.weekday() == 6 and 14 < date.day < 22:
-        return 'Vaderdag'
-    if date.month == 9 and date.weekday() == 1 and 15 < date.day < 23:
-        return 'Prinsjesdag'
-    if date.month == 10 and date.weekday() == 6 and date.day > 24:
-        return 'Wintertijd\nVergeet niet je klok een uur terug te zetten!'
-
-    # Easte related
-    easter_date = easter.easter(date.year)
-    if date == easter_date:
-        return 'Eerste Paasdag'
-    if date == easter_date + datetime.timedelta(days=-2):
-        return 'Goede Vrijdag'
-    if date == easter_date + datetime.timedelta(days=1):
-        return 'Tweede Paasdag'
-    if date == easter_date + datetime.timedelta(days=39):
-        return 'Hemelvaart'
-    if date == easter_date + datetime.timedelta(days=49):
-        return 'Eerste Pinksterdag'
-    if date == easter_date + datetime.timedelta(days=50):
-        return 'Tweede Pinksterdag'
-
-    carnaval_date = easter_date
-    i = 40  # Carnaval is 40 days before easter
-    while i:
-        # Sundays don't count towards these 40 days
-        if carnaval_date.weekday() != 6:
-            i -= 1
-        carnaval_date -= datetime.timedelta(days=1)
-    for i in range(3):
-        if date == carnaval_date - datetime.timedelta(days=i):
-            return 'Carnaval'
-    return ''
+    return _holiday_table(date.year).get(date, '')
+
+
+def index_by_day(dates):
+    """
+    Index a mapping of dates by their month and day.
+
+    Args:
+        dates (dict): A mapping of dates to an iterable of values, such as
+            the ``birthdays`` or ``weddings`` of a configuration file.
+
+    Returns:
+        dict: A dict mapping a tuple of a month and a day to a list of
+            tuples containing the original year and a value.
+
+    """
+    index = {}
+    for date, values in dates.items():
+        entries = index.setdefault((date.month, date.day), [])
+        for value in values:
+            entries.append((date.year, value))
+    return index
 
 
 def process_birthdays(date, birthdays):
@@ -156,20 +278,14 @@ def process_birthdays(date, birthdays):
 
     Args:
         date (datetime.date): The date to process.
-        birthdays (dict): A mapping of birthdays to an iterable of names
-            whose birthday it is.
+        birthdays (dict): Birthdays indexed using :func:`.index_by_day`.
 
     Yields:
-        dict: A dict containing a persons name and age.
+        tuple: A tuple containing a persons name and age.
 
     """
-    for birthdate, names in birthdays.items():
-        if birthdate.month == date.month and birthdate.day == date.day:
-            for name in names:
-                yield dict(
-                    name=name,
-                    age=date.year - birthdate.year
-                )
+    for birth_year, name in birthdays.get((date.month, date.day), ()):
+        yield name, date.year - birth_year
 
 
 def process_weddings(date, weddings):
@@ -178,21 +294,15 @@ def process_weddings(date, weddings):
 
     Args:
         date (datetime.date): The date to process.
-        weddings (dict): A mapping of wedding dates to an iterable of
-            iterables of names in that marriage.
+        weddings (dict): Weddings indexed using :func:`.index_by_day`.
 
     Yields:
-        dict: A dict containing the age of the marriage and the names
-            joined to one string.
+        tuple: A tuple containing the names joined to one string and the
+            age of the marriage.
 
     """
-    for wedding_date, couples in weddings.items():
-        if wedding_date.month == date.month and wedding_date.day == date.day:
-            for couple in couples:
-                yield dict(
-                    names=' & '.join(couple),
-                    age=date.year - wedding_date.year
-                )
+    for wedding_year, couple in weddings.get((date.month, date.day), ()):
+        yield ' & '.join(couple), date.year - wedding_year
 
 
 def day_to_dict(date, birthdays, weddings, special_dates):
@@ -201,8 +311,8 @@ def day_to_dict(date, birthdays, weddings, special_dates):
 
     Args:
         date (datetime.date): The date to process.
-        birthdays (dict): A dict of dates mapped to birthdays.
-        weddings (dict): A dict of dates mapped to wedding dates.
+        birthdays (dict): Birthdays indexed using :func:`.index_by_day`.
+        weddings (dict): Weddings indexed using :func:`.index_by_day`.
         special_dates (dict): A dict mapping a date in the form '%m-%d'
             to a special string to render.
 
@@ -210,7 +320,7 @@ def day_to_dict(date, birthdays, weddings, special_dates):
         dict: A dict containing:
 
         :day: The day of the month.
-        :month: The month of the date as a long string.
+        :month: The month of the date as a long capitalized string.
         :short_month: The month of the date as a short lower case string.
         :week_day: The day of the week as a long capitalized string.
         :events: A list of strings representing the events on that day.
@@ -220,23 +330,25 @@ def day_to_dict(date, birthdays, weddings, special_dates):
     hol = holiday(date)
     if hol:
         events.append(hol)
+    special_key = '{:02d}-{:02d}'.format(date.month, date.day)
     with contextlib.suppress(KeyError):
-        events.append(special_dates[date.strftime('%m-%d')])
-    for birthday in process_birthdays(date, birthdays):
-        events.append('{0[name]} {0[age]} jaar'.format(birthday))
-    for wedding in process_weddings(date, weddings):
-        events.append('{0[names]} {0[age]} jaar getrouwd'.format(wedding))
+        events.append(special_dates[special_key])
+    for name, age in process_birthdays(date, birthdays):
+        events.append('{} {} jaar'.format(name, age))
+    for names, age in process_weddings(date, weddings):
+        events.append('{} {} jaar getrouwd'.format(names, age))
     result = dict(
-        day=int(date.strftime('%d')),
-        month=date.strftime('%B'),
-        short_month=date.strftime('%b'),
-        week_day=date.strftime('%A').capitalize(),
+        day=date.day,
+        month=MONTHS[date.month - 1],
+        short_month=SHORT_MONTHS[date.month - 1],
+        week_day=WEEK_DAYS[date.weekday()],
         events=events
     )
-    log = '{0[week_day]:<10} {0[day]:>2} {0[month]}'.format(result)
-    if events:
-        log += ' ({})'.format(', '.join(events)).replace('\n', ': ')
-    print(log)
+    if logger.isEnabledFor(logging.INFO):
+        log = '{0[week_day]:<10} {0[day]:>2} {0[month]}'.format(result)
+        if events:
+            log += ' ({})'.format(', '.join(events)).replace('\n', ': ')
+        logger.info(log)
     return result
 
 
@@ -246,8 +358,8 @@ def create_week(start_date, birthdays, weddings, special_dates):
 
     Args:
         start_date (datetime.date): The first day of the week to render.
-        birthdays (dict): A dict of dates mapped to birthdays.
-        weddings (dict): A dict of dates mapped to wedding dates.
+        birthdays (dict): Birthdays indexed using :func:`.index_by_day`.
+        weddings (dict): Weddings indexed using :func:`.index_by_day`.
         special_dates (dict): A dict mapping a date in the form '%m-%d'
             to a special string to render.
 
@@ -257,20 +369,15 @@ def create_week(start_date, birthdays, weddings, special_dates):
 
     """
     week_number = start_date.isocalendar()[1]
-    print('\n    Week {: <2d}'.format(week_number))
+    logger.info('\n    Week %-2d', week_number)
     args = birthdays, weddings, special_dates
-    week = dict(
-        weeknumber=week_number,
-        mon=day_to_dict(start_date, *args),
-        tue=day_to_dict(start_date + datetime.timedelta(days=1), *args),
-        wed=day_to_dict(start_date + datetime.timedelta(days=2), *args),
-        thu=day_to_dict(start_date + datetime.timedelta(days=3), *args),
-        fri=day_to_dict(start_date + datetime.timedelta(days=4), *args),
-        sat=day_to_dict(start_date + datetime.timedelta(days=5), *args),
-        sun=day_to_dict(start_date + datetime.timedelta(days=6), *args),
-    )
-    first_month = week['sun']['month'].capitalize()
-    last_month = week['mon']['month'].capitalize()
+    ordinal = start_date.toordinal()
+    week = dict(weeknumber=week_number)
+    for i, key in enumerate(WEEK_DAY_KEYS):
+        date = datetime.date.fromordinal(ordinal + i)
+        week[key] = day_to_dict(date, *args)
+    first_month = week['sun']['month']
+    last_month = week['mon']['month']
     if first_month == last_month:
         week['month'] = first_month
     else:
@@ -278,28 +385,59 @@ def create_week(start_date, birthdays, weddings, special_dates):
     return week
 
 
-def create_weeks_for_year(year, birthdays, weddings, special_dates):
+def _init_worker(*args):
+    """
+    Store the arguments for :func:`.create_week` in a worker process.
+
+    This prevents the data from being pickled for every week.
+
+    """
+    global _worker_args
+    _worker_args = args
+
+
+def _create_week_in_worker(start_date):
+    """
+    Generate a week using the arguments stored by :func:`._init_worker`.
+
+    """
+    return create_week(start_date, *_worker_args)
+
+
+def create_weeks_for_year(year, birthdays, weddings, special_dates, jobs=1):
     """
     Generate all week data for a year
 
     Args:
         year (int): The year to generate week data for.
-        birthdays (dict): A dict of dates mapped to birthdays.
-        weddings (dict): A dict of dates mapped to wedding dates.
+        birthdays (dict): Birthdays indexed using :func:`.index_by_day`.
+        weddings (dict): Weddings indexed using :func:`.index_by_day`.
         special_dates (dict): A dict mapping a date in the form '%m-%d'
             to a special string to render.
+        jobs (int): The number of processes to generate the weeks in. If
+            this is ``None``, the number of CPUs is used.
 
     Yields:
         dict: All weeks for a year generated using :func:`.create_week`.
 
     """
-    first_date = start_date(year)
-    while first_date.year <= year:
-        yield create_week(first_date, birthdays, weddings, special_dates)
-        first_date += datetime.timedelta(days=7)
-
-
-def generate(template_path, data_file, out_file=None, year=None):
+    first_ordinal = start_date(year).toordinal()
+    last_ordinal = datetime.date(year, 12, 31).toordinal()
+    start_dates = (
+        datetime.date.fromordinal(ordinal)
+        for ordinal in range(first_ordinal, last_ordinal + 1, 7))
+    if jobs == 1:
+        for date in start_dates:
+            yield create_week(date, birthdays, weddings, special_dates)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+            jobs,
+            initializer=_init_worker,
+            initargs=(birthdays, weddings, special_dates)) as executor:
+        yield from executor.map(_create_week_in_worker, start_dates)
+
+
+def generate(template_path, data_file, out_file=None, year=None, jobs=1):
     """
     Generate a week calendar for an entire year in odt format.
 
@@ -310,28 +448,33 @@ def generate(template_path, data_file, out_file=None, year=None):
             to.
         year (int): The year to render the calendar for. A year
             specified in the data_file is used as a fallback value.
+        jobs (int): The number of processes to generate the weeks in. If
+            this is ``None``, the number of CPUs is used.
 
     Raises:
         .BadConfigError: If the given configuration file is missing
             configurations.
 
     """
-    with open(data_file) as f:
-        calendar_data = yaml.load(f, yaml.Loader)
+    calendar_data = load_config(data_file)
     try:
         year = year or calendar_data['year']
-        birthdays = calendar_data['birthdays']
-        weddings = calendar_data['weddings']
+        birthdays = index_by_day(calendar_data['birthdays'])
+        weddings = index_by_day(calendar_data['weddings'])
         special_dates = calendar_data['special dates']
     except KeyError:
         raise BadConfigError()
-    weeks = create_weeks_for_year(year, birthdays, weddings, special_dates)
-    template = Template(source=None, filepath=template_path)
-    generated = template.generate(weeks=weeks)
-    data = generated.render().getvalue()
+    # The template iterates over the weeks only once, so they are generated
+    # lazily while rendering. Use a list if the template ever needs to
+    # iterate over them more than once.
+    weeks = create_weeks_for_year(
+        year, birthdays, weddings, special_dates, jobs)
+    generated = load_template(template_path).generate(weeks=weeks)
+    data = generated.render()
+    data.seek(0)
     if not out_file:
         out_file = open('calendar-{:d}.odt'.format(year), 'wb')
-    out_file.write(data)
+    shutil.copyfileobj(data, out_file)
 
 
 def main():
@@ -351,11 +494,24 @@ def main():
         type=argparse.FileType('wb'),
         help='The output file to write the calendar to.'
              ' (default: calendar-{year}.odt)')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='The number of processes to generate the calendar with.'
+             ' Use 0 for the number of CPUs. (default: 1)')
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help='Print each generated day and its events.')
     args = parser.parse_args()
-    locale.setlocale(locale.LC_TIME, 'nl_NL.utf8')
+    logging.basicConfig(
+        format='%(message)s',
+        level=logging.INFO if args.verbose else logging.WARNING)
     try:
         template_path = os.path.join(os.path.dirname(__file__), 'template.odt')
-        generate(template_path, args.config, args.output, args.year)
+        generate(template_path, args.config, args.output, args.year,
+                 args.jobs or None)
     except BadConfigError:
         parser.print_help()
 